@@ -11,19 +11,13 @@ class EnhancedQTableView(QTableView):
         if event.key() == Qt.Key.Key_C and (
             event.modifiers() & Qt.KeyboardModifier.ControlModifier
         ):
-            selected_indexes = sorted(self.selectedIndexes())
-
-            copy_text = ""
-            previous_row = selected_indexes[0].row()
-            first = True
+            model = self.model()
+            rows = {}
+            selected_indexes = sorted(
+                self.selectedIndexes(), key=lambda i: (i.row(), i.column())
+            )
             for index in selected_indexes:
-                if index.row() != previous_row:
-                    copy_text += "\n"
-                elif first:
-                    first = False
-                else:
-                    copy_text += "\t"
-                copy_text += str(self.model().data(index))
-                previous_row = index.row()
+                rows.setdefault(index.row(), []).append(str(model.data(index)))
+            copy_text = "\n".join("\t".join(cells) for cells in rows.values())
 
             QApplication.clipboard().setText(copy_text)
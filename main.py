@@ -1,10 +1,17 @@
 #!/usr/bin/env python
+import bisect
+import contextlib
+import csv
+import filecmp
+import importlib.util
 import os
 import shutil
 import signal
+import socket
 import sys
-from collections import defaultdict
-from datetime import datetime
+from collections import Counter
+from datetime import date, datetime
+from functools import lru_cache
 from pathlib import Path
 from typing import ClassVar, Set
 
@@ -14,13 +21,13 @@ import pandas as pd
 from matplotlib.backends.backend_qtagg import FigureCanvasQTAgg
 from matplotlib.figure import Figure
 from PyQt6.QtCore import (QAbstractTableModel, QByteArray, QDate, QLibraryInfo,
-                          QLocale, QSettings, Qt, QTimer, QTranslator)
+                          QLocale, QModelIndex, QSettings, QSocketNotifier, Qt,
+                          QThreadPool, QTimer, QTranslator, pyqtSignal)
 from PyQt6.QtGui import QFont, QIcon, QKeySequence, QShortcut
 from PyQt6.QtWidgets import (QApplication, QComboBox, QDateEdit, QDialog,
-                             QDialogButtonBox, QDockWidget, QDoubleSpinBox,
-                             QFormLayout, QHeaderView, QLineEdit, QMainWindow,
-                             QMessageBox, QStyledItemDelegate, QToolBar,
-                             QWidget)
+                             QDialogButtonBox, QDoubleSpinBox, QFormLayout,
+                             QHeaderView, QLineEdit, QMainWindow, QMessageBox,
+                             QStyledItemDelegate)
 
 from main_window import Ui_MainWindow
 
@@ -28,6 +35,9 @@ matplotlib.use("QtAgg")
 
 window = None
 
+# Feather storage needs pyarrow, without it the ledger stays a CSV file
+HAVE_PYARROW = importlib.util.find_spec("pyarrow") is not None
+
 
 class ColumnsMeta(type):
     def __getitem__(cls, x):
@@ -44,7 +54,8 @@ class Columns(metaclass=ColumnsMeta):
     Value = "Wert"
     Description = "Ausgabe"
 
-    displayOrder = [Date, Category, Shop, Description, Value]
+    displayOrder = (Date, Category, Shop, Description, Value)
+    _indexMap = {column: i for i, column in enumerate(displayOrder)}
     _displayTexts = {
         Date: "Datum",
         Shop: "Geschäft",
@@ -59,7 +70,7 @@ class Columns(metaclass=ColumnsMeta):
 
     @classmethod
     def index(cls, column):
-        return cls.displayOrder.index(column)
+        return cls._indexMap[column]
 
 
 def install_translator(app: QApplication) -> None:
@@ -98,6 +109,33 @@ class ComboBoxDelegate(QStyledItemDelegate):
         model.setData(index, editor.currentText(), Qt.ItemDataRole.EditRole)
 
 
+class LazyComboBox(QComboBox):
+    """Editable combo box that only adds its items once they are needed."""
+
+    def __init__(self, parent, get_items):
+        super().__init__(parent)
+        self.setEditable(True)
+        self._get_items = get_items
+        self._populated = False
+
+    def _populate(self):
+        if self._populated:
+            return
+        self._populated = True
+        text = self.currentText()
+        self.addItems(sorted(self._get_items()))
+        self.setCurrentText(text)
+
+    def showPopup(self):
+        self._populate()
+        super().showPopup()
+
+    def focusInEvent(self, event):
+        # Typing needs the items too, for the completer
+        self._populate()
+        super().focusInEvent(event)
+
+
 class DateDelegate(QStyledItemDelegate):
     def createEditor(self, parent, option, index):
         editor = QDateEdit(parent)
@@ -115,6 +153,12 @@ class DateDelegate(QStyledItemDelegate):
         )
 
     def displayText(self, value, locale):
+        return self._format_date(value)
+
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def _format_date(value):
+        # Called for every visible date on each repaint, and dates repeat a lot
         date = QDate.fromString(value, "yyyy-MM-dd")
         return date.toString("dd.MM.yyyy")
 
@@ -133,8 +177,9 @@ class CurrencyDelegate(QStyledItemDelegate):
         return editor
 
     def setEditorData(self, editor, index):
-        value = index.model().data(index, Qt.ItemDataRole.EditRole)
-        editor.setValue(float(value))
+        value = float(index.model().data(index, Qt.ItemDataRole.EditRole))
+        # Empty amounts are NaN, start those from zero
+        editor.setValue(0.0 if np.isnan(value) else value)
 
     def setModelData(self, editor, model, index):
         value = editor.value()
@@ -146,88 +191,468 @@ class CurrencyDelegate(QStyledItemDelegate):
 
 class MyTableModel(QAbstractTableModel):
     data_changed: bool
+    max_backups = 10
+    # Emitted with the names of the aggregates (see AGGREGATES) that changed
+    aggregatesChanged = pyqtSignal(set)
+    # Emitted from the save thread once a save started by save_csv is done
+    # Whether the save succeeded, and the error message if not
+    saveFinished = pyqtSignal(bool, str)
+
+    AGGREGATES = frozenset(["category", "month", "shop"])
+    _affected_aggregates = {
+        Columns.Value: AGGREGATES,
+        Columns.Date: frozenset(["month"]),
+        Columns.Category: frozenset(["category"]),
+        Columns.Shop: frozenset(["shop"]),
+    }
+    # The view asks for many roles per cell, only these are answered
+    _display_role = Qt.ItemDataRole.DisplayRole
+    _edit_role = Qt.ItemDataRole.EditRole
+    _alignment_role = Qt.ItemDataRole.TextAlignmentRole
+    _value_col = Columns.index(Columns.Value)
+    # Argument order of _update_aggregates
+    _aggregate_columns = (Columns.Date, Columns.Category, Columns.Shop, Columns.Value)
+    _col_align = {_value_col: Qt.AlignmentFlag.AlignRight}
 
     def __init__(self, file_path):
         super(MyTableModel, self).__init__()
         self.file_path = file_path
         self.locale = QLocale()
+        self._fmt_cache: dict[float, str] = {}
+        self._month_cache: dict[str, pd.Period] = {}
+        # A single thread, so saves are written one after another in order
+        self._save_pool = QThreadPool(self)
+        self._save_pool.setMaxThreadCount(1)
         self.load_csv()
 
     def load_csv(self, file_path=None):
         if file_path is None:
             file_path = self.file_path
-        if Path(file_path).is_file():
-            self._data = pd.read_csv(file_path, keep_default_na=False).sort_values(
-                by=Columns.Date, ignore_index=True
-            )
+        file_path = Path(file_path)
+        # Older versions stored the ledger as Parquet or CSV, migrate it on first load
+        source_path = file_path
+        if not file_path.is_file():
+            for suffix in (".parquet", ".csv"):
+                if file_path.with_suffix(suffix).is_file():
+                    source_path = file_path.with_suffix(suffix)
+                    break
+        migrate = source_path != file_path
+        if source_path.is_file():
+            columns = self._read_file(source_path)
+            # Sorting and the binary searches rely on yyyy-MM-dd strings,
+            # normalise each distinct date once
+            iso_dates = {
+                value: self._iso_date(value) for value in set(columns[Columns.Date])
+            }
+            dates = columns[Columns.Date] = [
+                iso_dates[value] for value in columns[Columns.Date]
+            ]
+            order = sorted(range(len(dates)), key=dates.__getitem__)
+            # One list per column in display order, rows sorted by date
+            columns = [
+                [columns[name][i] for i in order] for name in Columns.displayOrder
+            ]
+            # Categories and shops repeat a lot, share one object per distinct value
+            for name in (Columns.Category, Columns.Shop):
+                column = columns[Columns.index(name)]
+                distinct = {}
+                column[:] = [distinct.setdefault(value, value) for value in column]
         else:
             self.file_path.parent.mkdir(parents=True, exist_ok=True)
-            self._data = pd.DataFrame(columns=Columns.displayOrder)
+            columns = [[] for _ in Columns.displayOrder]
+        self.beginResetModel()
+        self._columns = columns
+        # Formatted amounts, kept in step with the Value column
+        self._value_texts = list(
+            map(self._display_text, self._columns[self._value_col])
+        )
+        # Occurrences per value, for the combo box candidates
+        self._value_counts = {
+            column: Counter(self._columns[Columns.index(column)])
+            for column in (Columns.Category, Columns.Shop)
+        }
+        self.endResetModel()
         self.data_changed = False
+        self.compute_aggregates()
+        if migrate:
+            self.save_csv(file_path, migrated_from=source_path)
 
-    def save_csv(self, file_path=None):
+    @staticmethod
+    def _iso_date(value):
+        try:
+            if isinstance(value, date):
+                return value.strftime("%Y-%m-%d")
+            return date.fromisoformat(value).isoformat()
+        except (TypeError, ValueError):
+            return value
+
+    @classmethod
+    def _read_file(cls, file_path):
+        """Read the ledger from a Feather, Parquet or CSV file into column lists."""
+        if file_path.suffix in (".feather", ".parquet"):
+            if file_path.suffix == ".feather":
+                data = pd.read_feather(file_path, columns=list(Columns.displayOrder))
+            else:
+                # Map the file instead of reading it into an intermediate buffer
+                data = pd.read_parquet(
+                    file_path,
+                    engine="pyarrow",
+                    columns=list(Columns.displayOrder),
+                    memory_map=True,
+                )
+            # Empty text cells come back as nulls, read them as "" like the CSV path
+            for name in Columns.displayOrder:
+                if name != Columns.Value:
+                    data[name] = data[name].fillna("")
+        else:
+            try:
+                return cls._read_csv(file_path)
+            except (ValueError, csv.Error):
+                data = pd.read_csv(file_path, keep_default_na=False)
+        # Earlier migrations could store text amounts, which Arrow can't write back
+        # once an edit mixes in floats
+        data[Columns.Value] = cls._parse_amounts(data[Columns.Value])
+        return {name: data[name].tolist() for name in Columns.displayOrder}
+
+    @staticmethod
+    def _parse_amounts(amounts):
+        """Convert amounts to floats, empty or unreadable ones become NaN."""
+        if not pd.api.types.is_numeric_dtype(amounts):
+            # Text amounts may use a decimal comma
+            amounts = amounts.astype(str).str.replace(",", ".", regex=False)
+        return pd.to_numeric(amounts, errors="coerce").astype(np.float64)
+
+    @staticmethod
+    def _read_csv(file_path):
+        """Read the ledger with csv.reader into a dict of column lists.
+
+        The schema is fixed, so this skips the type inference and NA handling of
+        pd.read_csv. Raises ValueError if the file does not match the schema.
+        """
+        with open(file_path, newline="", encoding="utf-8", buffering=1 << 20) as f:
+            reader = csv.reader(f)
+            header = next(reader, None)
+            if header is None or sorted(header) != sorted(Columns.displayOrder):
+                raise ValueError(f"Unerwartete Spalten: {header}")
+            rows = [row for row in reader if row]
+        if any(len(row) != len(header) for row in rows):
+            raise ValueError("Zeilen mit falscher Spaltenanzahl")
+        columns = dict(zip(header, zip(*rows))) if rows else dict.fromkeys(header, ())
+        columns = {name: list(values) for name, values in columns.items()}
+        columns[Columns.Value] = list(map(float, columns[Columns.Value]))
+        return columns
+
+    def _as_dataframe(self):
+        return pd.DataFrame(dict(zip(Columns.displayOrder, self._columns)))
+
+    def compute_aggregates(self):
+        df = self._as_dataframe()
+        amounts = self._parse_amounts(df[Columns.Value]).to_numpy()
+        months = pd.to_datetime(
+            df[Columns.Date], format="%Y-%m-%d", errors="coerce", cache=True
+        ).dt.to_period("M")
+        # Skip rows with unparsable amount or date
+        valid = ~np.isnan(amounts) & months.notna().to_numpy()
+        amounts = amounts[valid]
+        shops = df[Columns.Shop].to_numpy()[valid]
+        has_shop = shops != ""
+        self.category_sums = self._sum_by(
+            df[Columns.Category].to_numpy()[valid], amounts
+        )
+        self.by_month = self._sum_by(months.to_numpy()[valid], amounts)
+        self.by_shop = self._sum_by(shops[has_shop], amounts[has_shop])
+        self.aggregatesChanged.emit(set(self.AGGREGATES))
+
+    @staticmethod
+    def _sum_by(keys, amounts):
+        """Sum amounts per distinct key in a single pass over the arrays."""
+        # Hash-based codes, only the distinct labels get sorted
+        codes, labels = pd.factorize(keys, sort=True)
+        # Missing keys get the code -1, leave them out
+        known = codes >= 0
+        sums = np.bincount(codes[known], weights=amounts[known], minlength=len(labels))
+        return dict(zip(labels.tolist(), sums.tolist()))
+
+    def _aggregate_fields(self, row):
+        return tuple(
+            self._columns[Columns.index(column)][row]
+            for column in self._aggregate_columns
+        )
+
+    def _update_aggregates(self, date, category, shop, value, sign):
+        """Add (sign=1) or remove (sign=-1) an entry from the cached aggregates."""
+        try:
+            if isinstance(value, str):
+                value = value.replace(",", ".")
+            amount = sign * float(value)
+            month = self._month(date)
+        except (TypeError, ValueError):
+            return
+        if np.isnan(amount):
+            return
+        buckets = [(self.category_sums, category), (self.by_month, month)]
+        if shop != "":
+            buckets.append((self.by_shop, shop))
+        for sums, key in buckets:
+            total = sums.get(key, 0.0) + amount
+            if abs(total) < 0.005:
+                sums.pop(key, None)
+            else:
+                sums[key] = total
+
+    def _month(self, date):
+        month = self._month_cache.get(date)
+        if month is None:
+            parsed = datetime.strptime(date, "%Y-%m-%d")
+            month = pd.Period(year=parsed.year, month=parsed.month, freq="M")
+            self._month_cache[date] = month
+        return month
+
+    def save_csv(self, file_path=None, migrated_from=None):
+        """Save a snapshot of the data in the background, see saveFinished.
+
+        migrated_from is a legacy ledger that is moved aside once the data is
+        saved, so later starts don't migrate it again.
+        """
         if file_path is None:
             file_path = self.file_path
-        self.create_backup(file_path)
-        self._data.to_csv(file_path, index=False)
+        columns = [list(column) for column in self._columns]
         self.data_changed = False
+        self._save_pool.start(
+            lambda: self._write_csv(columns, file_path, migrated_from)
+        )
+
+    def wait_for_save(self):
+        self._save_pool.waitForDone()
+
+    def _write_csv(self, columns, file_path, migrated_from=None):
+        """Runs in the save thread."""
+        # Write to a temporary file first, so the previous save can become the
+        # backup by a hard link instead of a full copy
+        tmp_file_path = f"{file_path}.tmp"
+        error = ""
+        try:
+            suffix = Path(file_path).suffix
+            if suffix in (".feather", ".parquet"):
+                data = pd.DataFrame(dict(zip(Columns.displayOrder, columns)))
+                data[Columns.Value] = self._parse_amounts(data[Columns.Value])
+                if suffix == ".feather":
+                    data.to_feather(tmp_file_path)
+                else:
+                    data.to_parquet(
+                        tmp_file_path, engine="pyarrow", compression="zstd", index=False
+                    )
+            else:
+                with open(
+                    tmp_file_path, "w", newline="", encoding="utf-8", buffering=1 << 23
+                ) as f:
+                    # Rows straight from the column lists, no DataFrame needed
+                    writer = csv.writer(f, lineterminator="\n")
+                    writer.writerow(Columns.displayOrder)
+                    values = columns[Columns.index(Columns.Value)]
+                    # Empty amounts are read as NaN, write them back empty
+                    columns[Columns.index(Columns.Value)] = [
+                        "" if value != value else value for value in values
+                    ]
+                    writer.writerows(zip(*columns))
+            # Nothing changed on disk, so keep the file and don't add a backup
+            if Path(file_path).is_file() and filecmp.cmp(
+                tmp_file_path, file_path, shallow=False
+            ):
+                os.remove(tmp_file_path)
+            else:
+                # Make sure the data is on disk before it replaces the old file
+                with open(tmp_file_path, "rb+") as f:
+                    os.fsync(f.fileno())
+                self.create_backup(file_path)
+                os.replace(tmp_file_path, file_path)
+            if migrated_from is not None:
+                os.replace(migrated_from, f"{migrated_from}.bak")
+        except Exception as e:
+            # Anything escaping here would end the save thread without a report
+            error = str(e) or type(e).__name__
+            self.data_changed = True
+            with contextlib.suppress(OSError):
+                os.remove(tmp_file_path)
+        finally:
+            self.saveFinished.emit(not error, error)
 
     def create_backup(self, file_path: str):
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         backup_file_path = f"{file_path}_{timestamp}.bak"
         if Path(file_path).is_file():
-            shutil.copyfile(file_path, backup_file_path)
+            # Link instead of rename, so the ledger stays in place until the
+            # new version replaces it
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(backup_file_path)
+            try:
+                os.link(file_path, backup_file_path)
+            except OSError:
+                shutil.copy2(file_path, backup_file_path)
+        # The timestamps sort chronologically, so the oldest backups come first
+        backups = sorted(Path(file_path).parent.glob(f"{Path(file_path).name}_*.bak"))
+        for old_backup in backups[: -self.max_backups]:
+            old_backup.unlink()
 
     def rowCount(self, index=None):
-        return len(self._data)
+        return len(self._columns[0])
 
     def columnCount(self, index=None):
-        return len(self._data.columns)
+        return len(self._columns)
 
     def data(self, index, role=Qt.ItemDataRole.DisplayRole):
-        data = self._data.iloc[index.row()][Columns[index.column()]]
-        if role == Qt.ItemDataRole.DisplayRole:
-            if not isinstance(data, str):
-                data = self.locale.toString(data, "f", 2) + "\u2009€"
-            return data
-        elif role == Qt.ItemDataRole.TextAlignmentRole:
-            if index.column() == Columns.index(Columns.Value):
-                return Qt.AlignmentFlag.AlignRight
-        if role == Qt.ItemDataRole.EditRole:
-            if not isinstance(data, str):
-                data = float(data)
-            return data
+        # Called for every role of every visible cell, so look things up only once
+        column = index.column()
+        if role == self._display_role:
+            if column == self._value_col:
+                return self._value_texts[index.row()]
+            data = self._columns[column][index.row()]
+            return data if isinstance(data, str) else self._format_value(data)
+        if role == self._alignment_role:
+            return self._col_align.get(column)
+        if role == self._edit_role:
+            data = self._columns[column][index.row()]
+            return data if isinstance(data, str) else float(data)
+        return None
+
+    def _display_text(self, value):
+        return value if isinstance(value, str) else self._format_value(value)
+
+    def _format_value(self, value):
+        if value != value:
+            # NaN, an empty or unreadable amount
+            return ""
+        # Amounts repeat a lot, so format each distinct one only once
+        text = self._fmt_cache.get(value)
+        if text is None:
+            text = self.locale.toString(value, "f", 2) + "\u2009€"
+            self._fmt_cache[value] = text
+        return text
 
     def setData(self, index, value, role=Qt.ItemDataRole.EditRole):
         if role == Qt.ItemDataRole.EditRole:
-            old_val = self._data.loc[index.row(), Columns[index.column()]]
+            column = self._columns[index.column()]
+            old_val = column[index.row()]
             if old_val == value:
                 return True
-            self._data.loc[index.row(), Columns[index.column()]] = value
+            affected = self._affected_aggregates.get(Columns[index.column()])
+            if affected:
+                self._update_aggregates(*self._aggregate_fields(index.row()), -1)
+            counts = self._value_counts.get(Columns[index.column()])
+            if counts is not None:
+                counts[old_val] -= 1
+                if counts[old_val] <= 0:
+                    del counts[old_val]
+                counts[value] += 1
+            column[index.row()] = value
+            if index.column() == self._value_col:
+                self._value_texts[index.row()] = self._display_text(value)
+            if affected:
+                self._update_aggregates(*self._aggregate_fields(index.row()), 1)
             self.dataChanged.emit(
                 index, index, (Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.EditRole)
             )
             self.data_changed = True
+            if affected:
+                self.aggregatesChanged.emit(set(affected))
+            if index.column() == Columns.index(Columns.Date):
+                self._move_to_sorted_position(index.row())
             return True
         return False
 
+    def _move_to_sorted_position(self, row):
+        """Move a row whose date changed so the rows stay sorted by date."""
+        dates = self._columns[Columns.index(Columns.Date)]
+        date = dates[row]
+        if row > 0 and date < dates[row - 1]:
+            destination = bisect.bisect_right(dates, date, 0, row)
+        elif row + 1 < len(dates) and date > dates[row + 1]:
+            destination = bisect.bisect_right(dates, date, row + 1)
+        else:
+            return
+        self.beginMoveRows(QModelIndex(), row, row, QModelIndex(), destination)
+        target = destination if destination < row else destination - 1
+        for column in (*self._columns, self._value_texts):
+            column.insert(target, column.pop(row))
+        self.endMoveRows()
+
     def insertRow(self, date, description, shop, category, value):
-        new = pd.DataFrame(
-            [
-                {
-                    Columns.Date: date,
-                    Columns.Shop: shop,
-                    Columns.Description: description,
-                    Columns.Value: value,
-                    Columns.Category: category,
-                }
-            ]
-        )
-        self._data = pd.concat(
-            [self._data, new], ignore_index=True, copy=False
-        ).sort_values(by=Columns.Date, ignore_index=True)
-        self.layoutChanged.emit()
+        new = {
+            Columns.Date: date,
+            Columns.Shop: shop,
+            Columns.Description: description,
+            Columns.Value: value,
+            Columns.Category: category,
+        }
+        # Rows are kept sorted by date and ISO dates sort lexically,
+        # so a binary search finds the position of the new row
+        row = bisect.bisect_right(self._columns[Columns.index(Columns.Date)], date)
+        self.beginInsertRows(QModelIndex(), row, row)
+        for name, column in zip(Columns.displayOrder, self._columns):
+            column.insert(row, new[name])
+        self._value_texts.insert(row, self._display_text(value))
+        self.endInsertRows()
+        self.data_changed = True
+        self._value_counts[Columns.Category][category] += 1
+        self._value_counts[Columns.Shop][shop] += 1
+        self._update_aggregates(date, category, shop, value, 1)
+        self.aggregatesChanged.emit(set(self.AGGREGATES))
+
+    def insert_entries(self, rows):
+        """Insert many entries at once, e.g. for an import.
+
+        rows are dicts mapping the column names to values. Instead of one binary
+        search and list shift per entry, the rows are appended and sorted once.
+        """
+        rows = list(rows)
+        if not rows:
+            return
+        # Build the new entries before touching the model, so a row with a
+        # missing column or an invalid date leaves it unchanged
+        new = {name: [row[name] for row in rows] for name in Columns.displayOrder}
+        iso_dates = {value: self._iso_date(value) for value in set(new[Columns.Date])}
+        new[Columns.Date] = [iso_dates[value] for value in new[Columns.Date]]
+        # Other formats would sort wrongly and drop out of the charts unnoticed
+        for value in iso_dates.values():
+            try:
+                valid = date.fromisoformat(value).isoformat() == value
+            except (TypeError, ValueError):
+                valid = False
+            if not valid:
+                raise ValueError(f"Ungültiges Datum: {value!r}, erwartet JJJJ-MM-TT")
+        new[Columns.Value] = self._parse_amounts(
+            pd.Series(new[Columns.Value], dtype=object)
+        ).tolist()
+        # Share one object per distinct value with the existing entries
+        for name in (Columns.Category, Columns.Shop):
+            distinct = {value: value for value in self._value_counts[name]}
+            new[name] = [distinct.setdefault(value, value) for value in new[name]]
+        value_texts = list(map(self._display_text, new[Columns.Value]))
+        self.beginResetModel()
+        try:
+            for name, column in zip(Columns.displayOrder, self._columns):
+                column.extend(new[name])
+            self._value_texts.extend(value_texts)
+            # sorted() is stable, so new entries go after existing ones of the same date
+            dates = self._columns[Columns.index(Columns.Date)]
+            order = sorted(range(len(dates)), key=dates.__getitem__)
+            for column in (*self._columns, self._value_texts):
+                column[:] = [column[i] for i in order]
+        finally:
+            self.endResetModel()
         self.data_changed = True
+        self._value_counts[Columns.Category].update(new[Columns.Category])
+        self._value_counts[Columns.Shop].update(new[Columns.Shop])
+        for entry in zip(*(new[column] for column in self._aggregate_columns)):
+            self._update_aggregates(*entry, 1)
+        self.aggregatesChanged.emit(set(self.AGGREGATES))
+
+    def import_file(self, file_path):
+        """Add the entries of another Feather, Parquet or CSV ledger."""
+        columns = self._read_file(Path(file_path))
+        self.insert_entries(
+            dict(zip(columns, values)) for values in zip(*columns.values())
+        )
 
     def flags(self, index):
         return (
@@ -247,13 +672,13 @@ class MyTableModel(QAbstractTableModel):
                 return str(section + 1)
 
     def get_row(self, row):
-        return self._data.iloc[row]
+        return [column[row] for column in self._columns]
 
     def get_used_categories(self):
-        return set(self._data[Columns.Category])
+        return set(self._value_counts[Columns.Category])
 
     def get_used_shops(self):
-        return set(self._data[Columns.Shop])
+        return set(self._value_counts[Columns.Shop])
 
 
 class MplCanvas(FigureCanvasQTAgg):
@@ -262,16 +687,65 @@ class MplCanvas(FigureCanvasQTAgg):
         fig = Figure(figsize=(width, height), dpi=dpi)
         self.axes = fig.add_subplot(111)
         super().__init__(fig)
-        self.figure.set_layout_engine("tight")
         fig.set_layout_engine("tight")
         if title:
             fig.suptitle(title)
-
-    def bar(self, *kargs, **kwargs):
+        # Artists of the last plot, reused while the labels stay the same
+        self._bars = None
+        self._bar_texts = None
+        self._bar_labels = None
+        self._pie = None
+        self._pie_labels = None
+        # Labels and rounded values of the last plot, to skip redrawing the same
+        self._last_input = None
+
+    @staticmethod
+    def _input_key(kind, labels, values):
+        return (kind, tuple(labels), tuple(round(value, 2) for value in values))
+
+    def _clear(self):
         self.axes.cla()
-        bar = self.axes.bar(*kargs, **kwargs)
-        self.axes.bar_label(bar, fmt="{:,.2f}\u2009€")
-        self.draw()
+        self._bar_labels = None
+        self._pie_labels = None
+
+    def bar(self, x, height, **kwargs):
+        x = list(x)
+        key = self._input_key("bar", x, height)
+        if key == self._last_input:
+            return
+        if x == self._bar_labels:
+            for rect, text, value in zip(self._bars, self._bar_texts, height):
+                rect.set_height(value)
+                text.xy = (rect.get_x() + rect.get_width() / 2, value)
+                text.set_text(f"{value:,.2f}\u2009€")
+            self.axes.relim()
+            self.axes.autoscale_view()
+        else:
+            self._clear()
+            self._bars = self.axes.bar(x, height, **kwargs)
+            self._bar_texts = self.axes.bar_label(self._bars, fmt="{:,.2f}\u2009€")
+            self._bar_labels = x
+        self.draw_idle()
+        # Only remember a plot that was drawn, a failed one is retried next time
+        self._last_input = key
+
+    def _update_pie(self, data, startangle=0, autopct=None, **kwargs):
+        """Move the wedges and texts of the last pie to the new data."""
+        wedges, texts, autotexts = self._pie
+        total = sum(data)
+        theta1 = startangle
+        for i, (wedge, text, value) in enumerate(zip(wedges, texts, data)):
+            theta2 = theta1 + 360 * value / total
+            wedge.set_theta1(theta1)
+            wedge.set_theta2(theta2)
+            angle = np.deg2rad((theta1 + theta2) / 2)
+            x, y = np.cos(angle), np.sin(angle)
+            text.set_position((1.1 * x, 1.1 * y))
+            text.set_horizontalalignment("left" if x > 0 else "right")
+            if autotexts:
+                autotexts[i].set_position((0.6 * x, 0.6 * y))
+                autotexts[i].set_text(autopct % (100 * value / total))
+            theta1 = theta2
 
     def pie(self, data, *kargs, labels=None, **kwargs):
         def fix_labels(mylabels, tooclose=0.1, sepfactor=2):
@@ -289,27 +763,41 @@ class MplCanvas(FigureCanvasQTAgg):
                         mylabels[j].set_x(b[0] - sepfactor * vecs[i, j, 0])
                         mylabels[j].set_y(b[1] - sepfactor * vecs[i, j, 1])
 
-        if len(data) > 6:
+        # Slices below 2% only crowd their neighbours' labels
+        threshold = 0.02 * sum(data)
+        small = sum(value < threshold for value in data)
+        if len(data) > 6 or small > 1:
             # Sort categories and sums together by sums in ascending order
             sorted_zip = sorted(zip(data, labels))
 
             # Separate the sums and categories again after sorting
             sorted_data, sorted_labels = zip(*sorted_zip)
 
-            # Combine the smallest categories into "other"
-            other_sum = sum(sorted_data[:-4])
+            # Combine the smallest categories into "other", keeping at most the
+            # largest 4 categories
+            cut = max(len(sorted_data) - 4 if len(data) > 6 else 0, small)
+            other_sum = sum(sorted_data[:cut])
             other_label = "Andere"
 
-            # Keep the largest 4 categories plus the "other" category
-            data = list(sorted_data[-4:]) + [other_sum]
-            labels = list(sorted_labels[-4:]) + [other_label]
-        self.axes.cla()
-        wedges, labels, autopct = self.axes.pie(
-            data, *kargs, labels=labels, labeldistance=1.1, **kwargs
-        )
-        fix_labels(labels, sepfactor=2)
+            data = list(sorted_data[cut:]) + [other_sum]
+            labels = list(sorted_labels[cut:]) + [other_label]
+        labels = list(labels)
+        key = self._input_key("pie", labels, data)
+        if key == self._last_input:
+            return
+        if labels == self._pie_labels and sum(data) > 0:
+            self._update_pie(data, **kwargs)
+        else:
+            self._clear()
+            wedges, texts, *autotexts = self.axes.pie(
+                data, *kargs, labels=labels, labeldistance=1.1, **kwargs
+            )
+            self._pie = (wedges, texts, autotexts[0] if autotexts else [])
+            self._pie_labels = labels
+        fix_labels(self._pie[1], sepfactor=2)
 
-        self.draw()
+        self.draw_idle()
+        self._last_input = key
 
 
 class ResizeAbleFontWindow:
@@ -338,25 +826,20 @@ class ResizeAbleFontWindow:
         self.font_size -= 1
         self.update_font()
 
+    def _font_roots(self):
+        """Widgets to set the font on, their children inherit it."""
+        if isinstance(self, QMainWindow):
+            return (self.centralWidget(),)
+        if isinstance(self, QDialog):
+            return (self,)
+        return ()
+
     def update_font(self):
         font = QFont()
         font.setPointSize(self.font_size)
-        if isinstance(self, QMainWindow):
-            centralWidget = self.centralWidget()
-        elif isinstance(self, QDialog):
-            centralWidget = self
-        else:
-            return
-        self.setFontForAllWidgets(centralWidget, font)
-        self.setFontForAllWidgets(self.findChild(QToolBar), font)
-        self.setFontForAllWidgets(self.findChild(QDockWidget), font)
-
-    def setFontForAllWidgets(self, widget, font):
-        if widget is None:
-            return
-        widget.setFont(font)
-        for child in widget.findChildren(QWidget):
-            child.setFont(font)
+        # Children inherit the font, no need to walk the widget tree
+        for widget in self._font_roots():
+            widget.setFont(font)
 
 
 class MicroAccounting(QMainWindow, Ui_MainWindow, ResizeAbleFontWindow):
@@ -364,17 +847,20 @@ class MicroAccounting(QMainWindow, Ui_MainWindow, ResizeAbleFontWindow):
         Path(os.getenv("XDG_DATA_HOME", Path.home() / ".local" / "share"))
         / "microaccounting"
     )
-    file_path = data_dir / "Buchhaltung.csv"
+    file_path = data_dir / (
+        "Buchhaltung.feather" if HAVE_PYARROW else "Buchhaltung.csv"
+    )
 
     def __init__(self):
         Ui_MainWindow.__init__(self)
         QMainWindow.__init__(self)
-        ResizeAbleFontWindow.__init__(self)
         self.setupUi(self)
+        ResizeAbleFontWindow.__init__(self)
         self.actionSave.triggered.connect(self.save_csv)
         self.actionAdd_Entry.triggered.connect(self.open_entry_dialog)
 
         self.model = MyTableModel(self.file_path)
+        self.model.saveFinished.connect(self.handle_save_finished)
         self.table_widget.setModel(self.model)
 
         self.cat_delegate = ComboBoxDelegate(self.model, self.model.get_used_categories)
@@ -393,6 +879,9 @@ class MicroAccounting(QMainWindow, Ui_MainWindow, ResizeAbleFontWindow):
         self.table_widget.setItemDelegateForColumn(
             Columns.index(Columns.Value), self.value_delegate
         )
+        # Fit columns to the visible rows plus a sample around them,
+        # instead of asking the model for up to 1000 rows per column
+        self.table_widget.horizontalHeader().setResizeContentsPrecision(200)
         self.resize_columns()
 
         self.cat_chart = MplCanvas(self, title="Ausgaben pro Kategorie")
@@ -403,8 +892,21 @@ class MicroAccounting(QMainWindow, Ui_MainWindow, ResizeAbleFontWindow):
         self.shop_chart_layout.addWidget(self.shop_chart)
 
         self.toolBar.setContextMenuPolicy(Qt.ContextMenuPolicy.PreventContextMenu)
+        # Coalesce bursts of changes into one chart update, every change restarts
+        # the timer so quick successive edits only redraw once
+        self._dirty_charts = set()
+        self._chart_timer = QTimer(self)
+        self._chart_timer.setSingleShot(True)
+        self._chart_timer.setInterval(150)
+        self._chart_timer.timeout.connect(self.update_dirty_charts)
+        self._chart_widgets = {
+            "category": self.cat_chart,
+            "month": self.month_chart,
+            "shop": self.shop_chart,
+        }
+        self.tabWidget.currentChanged.connect(self.update_dirty_charts)
         self.update_charts()
-        self.model.dataChanged.connect(self.handle_item_changed)
+        self.model.aggregatesChanged.connect(self.handle_item_changed)
         self.resizeDocks(
             [self.dockWidget],
             [self.frameGeometry().width() // 3],
@@ -456,6 +958,10 @@ class MicroAccounting(QMainWindow, Ui_MainWindow, ResizeAbleFontWindow):
 
         IPython.embed()
 
+    def _font_roots(self):
+        # The toolbar and the dock are not below the central widget
+        return (self.centralWidget(), self.toolBar, self.dockWidget)
+
     def update_font(self):
         super().update_font()
         try:
@@ -465,6 +971,8 @@ class MicroAccounting(QMainWindow, Ui_MainWindow, ResizeAbleFontWindow):
             pass
 
     def closeEvent(self, event):
+        # A running save decides whether there are unsaved changes
+        self.model.wait_for_save()
         if self.model.data_changed:
             reply = QMessageBox.question(
                 self,
@@ -476,6 +984,11 @@ class MicroAccounting(QMainWindow, Ui_MainWindow, ResizeAbleFontWindow):
             )
             if reply == QMessageBox.StandardButton.Yes:
                 self.save_csv()
+                self.model.wait_for_save()
+                if self.model.data_changed:
+                    # Saving failed, handle_save_finished tells the user why
+                    event.ignore()
+                    return
                 self.save_geometry()
                 event.accept()
             elif reply == QMessageBox.StandardButton.No:
@@ -487,17 +1000,36 @@ class MicroAccounting(QMainWindow, Ui_MainWindow, ResizeAbleFontWindow):
             self.save_geometry()
             event.accept()
 
-    def handle_item_changed(self, _item=None):
-        self.update_charts()
+    def handle_item_changed(self, charts=None):
+        self._dirty_charts |= charts or self.model.AGGREGATES
+        self._chart_timer.start()
+
+    def update_dirty_charts(self):
+        # Charts on hidden tabs stay dirty until their tab is shown
+        charts = {
+            chart
+            for chart in self._dirty_charts
+            if self._chart_widgets[chart].isVisible()
+        }
+        self._dirty_charts -= charts
+        self.update_charts(charts)
 
     def load_csv(self, file_path: str):
         self.model.load_csv(file_path)
-        self.model.layoutChanged.emit()
-        self.update_charts()
 
     def save_csv(self):
+        self.actionSave.setEnabled(False)
         self.model.save_csv()
 
+    def handle_save_finished(self, success, error):
+        self.actionSave.setEnabled(True)
+        if not success:
+            QMessageBox.critical(
+                self,
+                "Fehler beim Speichern",
+                f"Die Daten konnten nicht gespeichert werden:\n{error}",
+            )
+
     def open_entry_dialog(self):
         def filter_text(text: str):
             prefixes = [
@@ -543,31 +1075,33 @@ class MicroAccounting(QMainWindow, Ui_MainWindow, ResizeAbleFontWindow):
                 category=category,
                 value=amount,
             )
-            self.handle_item_changed()
 
-    def update_charts(self):
-        category_sums = defaultdict(float)
-        by_month = defaultdict(float)
-        by_shop = defaultdict(float)
-        for row in range(self.model.rowCount()):
-            try:
-                _date, category, shop, _, _amount = self.model.get_row(row)
-                amount = float(_amount)
-                month = datetime.strptime(_date, "%Y-%m-%d").strftime("%b\n%Y")
-                category_sums[category] += amount
-                by_month[month] += amount
-                if shop != "":
-                    by_shop[shop] += amount
-            except ValueError as e:
-                print("Error", e)
+    def update_charts(self, charts=None):
+        if charts is None:
+            charts = self.model.AGGREGATES
         try:
-            categories = list(category_sums.keys())
-            sums = list(category_sums.values())
-            shops = list(by_shop.keys())
-            shop_sums = list(by_shop.values())
-            self.cat_chart.pie(sums, labels=categories, autopct="%i%%", startangle=140)
-            self.shop_chart.pie(shop_sums, labels=shops, autopct="%i%%", startangle=140)
-            self.month_chart.bar(by_month.keys(), by_month.values())
+            if "category" in charts:
+                sums = self.model.category_sums
+                self.cat_chart.pie(
+                    list(sums.values()),
+                    labels=list(sums.keys()),
+                    autopct="%i%%",
+                    startangle=140,
+                )
+            if "shop" in charts:
+                sums = self.model.by_shop
+                self.shop_chart.pie(
+                    list(sums.values()),
+                    labels=list(sums.keys()),
+                    autopct="%i%%",
+                    startangle=140,
+                )
+            if "month" in charts:
+                months = sorted(self.model.by_month)
+                self.month_chart.bar(
+                    [month.strftime("%b\n%Y") for month in months],
+                    [self.model.by_month[month] for month in months],
+                )
         except Exception as e:
             print("Error", e)
 
@@ -592,20 +1126,20 @@ class EntryDialog(QDialog, ResizeAbleFontWindow):
         self.date_edit.setDate(QDate.currentDate())
         self.layout.addRow(f"{Columns.displayText(Columns.Date)}:", self.date_edit)
 
-        self.category_edit = QComboBox(self)
-        self.category_edit.setEditable(True)
         if categories:
             all_categories = self.DEFAULT_CATEGORIES | categories
         else:
             all_categories = self.DEFAULT_CATEGORIES
-        self.category_edit.addItems(sorted(all_categories))
+        self.category_edit = LazyComboBox(self, lambda: all_categories)
+        # Start with the first item, as if the items had been added right away
+        self.category_edit.setCurrentText(min(all_categories))
         self.layout.addRow(
             f"{Columns.displayText(Columns.Category)}:", self.category_edit
         )
 
-        self.shop_edit = QComboBox(self)
-        self.shop_edit.setEditable(True)
-        self.shop_edit.addItems(sorted(shops))
+        self.shop_edit = LazyComboBox(self, lambda: shops or ())
+        if shops:
+            self.shop_edit.setCurrentText(min(shops))
         self.layout.addRow(f"{Columns.displayText(Columns.Shop)}:", self.shop_edit)
 
         self.description_edit = QLineEdit(self)
@@ -658,9 +1192,15 @@ def main():
     window = MicroAccounting()
     # Installiere den Translator
     window.show()
-    timer = QTimer()
-    timer.start(500)  # You may change this if you wish.
-    timer.timeout.connect(lambda: None)  # Let the interpreter run each 500 ms.
+    # Python runs signal handlers only between bytecodes, which never happens while
+    # Qt waits for events. The wakeup fd wakes the event loop on a signal, and
+    # the slot reading it lets the interpreter run the handler.
+    signal_reader, signal_writer = socket.socketpair()
+    signal_reader.setblocking(False)
+    signal_writer.setblocking(False)
+    signal.set_wakeup_fd(signal_writer.fileno())
+    notifier = QSocketNotifier(signal_reader.fileno(), QSocketNotifier.Type.Read)
+    notifier.activated.connect(lambda: signal_reader.recv(1))
     sys.exit(app.exec())
 
 